@@ -1,12 +1,15 @@
 import os
-import io
 import base64
+import hashlib
 import json
 import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import numpy as np
-from PIL import Image
 import tensorflow as tf
 from flask import Flask, request, jsonify, g
 from flask_cors import CORS
@@ -14,14 +17,17 @@ from werkzeug.utils import secure_filename
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
 from functools import wraps
+from cachetools import TTLCache
 import cv2
+from serving import MicroBatcher, OrjsonProvider, load_xnnpack_delegate
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (per-request details are DEBUG; set LOG_LEVEL=DEBUG to see them)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper())
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
@@ -68,24 +74,129 @@ Load ML model
 """
 # Use an absolute path relative to this file so the model is found regardless of cwd
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'plantdiseasedetection.keras')
+# INT8 and FP16 TFLite exports of the same model, produced by convert_to_tflite.py
+TFLITE_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'plantdiseasedetection_int8.tflite')
+TFLITE_FP16_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'plantdiseasedetection_fp16.tflite')
+# Which TFLite variant benchmarked faster on this host, so later worker starts skip the probe
+TFLITE_CHOICE_PATH = os.path.join(os.path.dirname(__file__), 'tflite_model_choice.json')
+TFLITE_BENCHMARK_RUNS = 5
+# XNNPACK delegate shared library; if it can't be loaded the interpreter's built-in XNNPACK is used
+XNNPACK_DELEGATE_PATH = os.getenv('XNNPACK_DELEGATE_PATH', 'libtensorflowlite_xnnpack_delegate.so')
+# Kernel threads per interpreter; gunicorn.conf.py sets OMP_NUM_THREADS to each worker's share of cores
+TFLITE_NUM_THREADS = int(os.getenv('OMP_NUM_THREADS', os.cpu_count()))
 model = None
+interpreter = None
+input_details = None
+output_details = None
+# Process that built the interpreter (the gunicorn master when preload_app is on)
+_interpreter_pid = None
+# Returns a writable numpy view of the interpreter's input tensor
+_input_tensor = None
+# uint8 pixel -> int8 model input table; None when the model uses scale 1/255, zero point -128
+_input_quant_lut = None
+# Graph-compiled Keras forward pass, used when no TFLite model is available
+keras_infer = None
+# Whether this process has a usable model (False after a failed load or per-worker rebuild)
+_MODEL_READY = False
 
-def load_model():
-    global model
+# Micro-batching: concurrent requests are stacked into a single forward pass
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 8))
+MAX_BATCH_WAIT_MS = float(os.getenv('MAX_BATCH_WAIT_MS', 10))
+# Serializes model (re)loads across a worker's request threads
+_model_lock = threading.Lock()
+
+def create_interpreter(model_path: str):
+    """Create and allocate a TFLite interpreter for the given model file"""
+    # model_path makes TFLite mmap the FlatBuffer read-only, so every process that loads
+    # it shares the same page-cache pages for the weights instead of a private copy
+    tflite_interpreter = tf.lite.Interpreter(
+        model_path=model_path,
+        num_threads=TFLITE_NUM_THREADS,
+        experimental_delegates=load_xnnpack_delegate(XNNPACK_DELEGATE_PATH, TFLITE_NUM_THREADS) or None
+    )
+    tflite_interpreter.allocate_tensors()
+    return tflite_interpreter
+
+def benchmark_tflite_model(model_path: str) -> float:
+    """Return the mean latency in ms of a few dummy invokes"""
+    tflite_interpreter = create_interpreter(model_path)
+    detail = tflite_interpreter.get_input_details()[0]
+    tflite_interpreter.set_tensor(detail['index'], np.zeros(detail['shape'], dtype=detail['dtype']))
+    tflite_interpreter.invoke()  # warm-up, not timed
+    start = time.perf_counter()
+    for _ in range(TFLITE_BENCHMARK_RUNS):
+        tflite_interpreter.invoke()
+    return (time.perf_counter() - start) * 1000.0 / TFLITE_BENCHMARK_RUNS
+
+def select_tflite_model() -> Optional[str]:
+    """Pick the faster of the INT8/FP16 models on this host, reusing a persisted choice"""
+    candidates = [path for path in (TFLITE_MODEL_PATH, TFLITE_FP16_MODEL_PATH) if os.path.exists(path)]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+    
+    # The stored choice is only valid for the exact model files it was measured on
+    fingerprint = {os.path.basename(path): os.path.getmtime(path) for path in candidates}
     try:
-        # Ensure eager-style execution (disabling eager causes tf.data iteration errors)
-        try:
-            if not tf.executing_eagerly():
-                try:
-                    tf.config.run_functions_eagerly(True)
-                    logger.info("Enabled eager-style function execution with tf.config.run_functions_eagerly(True)")
-                except Exception as inner_e:
-                    logger.warning(f"Could not enable eager-style execution: {str(inner_e)}")
-            else:
-                logger.info("Eager execution is enabled")
-        except Exception as e:
-            logger.warning(f"Error checking/enabling eager execution: {str(e)}")
+        with open(TFLITE_CHOICE_PATH, 'r') as f:
+            choice = json.load(f)
+        if choice.get('models') == fingerprint:
+            return os.path.join(os.path.dirname(TFLITE_MODEL_PATH), choice['selected'])
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    timings = {path: benchmark_tflite_model(path) for path in candidates}
+    selected = min(timings, key=timings.get)
+    logger.info("TFLite benchmark (ms/invoke): " +
+                ", ".join(f"{os.path.basename(path)}={ms:.1f}" for path, ms in timings.items()))
+    try:
+        with open(TFLITE_CHOICE_PATH, 'w') as f:
+            json.dump({
+                'selected': os.path.basename(selected),
+                'models': fingerprint,
+                'timings_ms': {os.path.basename(path): ms for path, ms in timings.items()}
+            }, f, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not persist TFLite model choice: {str(e)}")
+    return selected
 
+def load_tflite_model() -> bool:
+    """Load the fastest available TFLite model if one has been converted"""
+    global interpreter, input_details, output_details, _input_quant_lut, _interpreter_pid, _input_tensor
+    model_path = select_tflite_model()
+    if model_path is None:
+        return False
+    logger.info(f"Loading TFLite model from: {model_path}")
+    _interpreter_pid = os.getpid()
+    interpreter = create_interpreter(model_path)
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    _input_tensor = interpreter.tensor(input_details[0]['index'])
+    
+    # Fold the /255 normalization into the input quantization so uint8 pixels map
+    # directly to int8 without a float round trip
+    _input_quant_lut = None
+    if input_details[0]['dtype'] == np.int8:
+        scale, zero_point = input_details[0]['quantization']
+        if not (np.isclose(scale, 1.0 / 255.0) and zero_point == -128):
+            pixels = np.arange(256, dtype=np.float32) / np.float32(255.0)
+            _input_quant_lut = np.clip(np.round(pixels / scale + zero_point), -128, 127).astype(np.int8)
+    logger.info(f"Input shape: {input_details[0]['shape']}, dtype: {input_details[0]['dtype'].__name__}")
+    logger.info(f"Output shape: {output_details[0]['shape']}, dtype: {output_details[0]['dtype'].__name__}")
+    logger.info("✅ TFLite model loaded successfully")
+    return True
+
+def build_keras_inference_fn(keras_model):
+    """Wrap the Keras forward pass in an XLA-compiled function with a fixed input signature"""
+    # jit_compile fuses the CNN's elementwise ops on CPU too (set_jit auto-clustering is GPU-only);
+    # XLA compiles once per distinct batch size, which the batcher pads to a few fixed sizes
+    @tf.function(input_signature=[tf.TensorSpec((None, 160, 160, 3), tf.float32)], jit_compile=True)
+    def infer(x):
+        return keras_model(x, training=False)
+    return infer
+
+def load_model():
+    global model, keras_infer
+    try:
         # Configure TF to use CPU (optional)
         try:
             tf.config.set_visible_devices([], 'GPU')
@@ -93,10 +204,18 @@ def load_model():
             # ignore if can't set devices
             pass
         
+        # Prefer the quantized TFLite model; fall back to the Keras model
+        try:
+            if load_tflite_model():
+                return True
+        except Exception as e:
+            logger.warning(f"Could not load TFLite model, falling back to Keras: {str(e)}")
+
         logger.info(f"Attempting to load model from: {MODEL_PATH}")
         if os.path.exists(MODEL_PATH):
             logger.info("Model file found, attempting to load...")
             model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+            keras_infer = build_keras_inference_fn(model)
             logger.info("Model loaded into memory")
             logger.info("Model configuration:")
             logger.info(f"Input shape: {model.input_shape}")
@@ -118,7 +237,7 @@ def load_model():
 # Attempt to load model at import time so `/api/health` reports correct status and
 # predictions may work even if run via a different entrypoint.
 try:
-    load_model()
+    _MODEL_READY = load_model()
 except Exception:
     # load_model already logs errors; continue so health check can report model_loaded = False
     pass
@@ -174,14 +293,50 @@ PLANT_TYPES = {
     'tomato': [28, 29, 30, 31, 32, 33, 34, 35, 36, 37]
 }
 
+# Per-class plant name, disease name and health flag, indexed by class id
+_PLANT_BY_IDX = tuple(name.split('___')[0] for name in DISEASE_CLASSES.values())
+_DISEASE_BY_IDX = tuple(name.split('___')[1] if '___' in name else 'healthy' for name in DISEASE_CLASSES.values())
+_IS_HEALTHY_BY_IDX = tuple('healthy' in disease.lower() for disease in _DISEASE_BY_IDX)
+
+# Recommendation category keywords, checked in this order. No class name has a later
+# keyword before an earlier one (e.g. "Leaf_blight_..._Leaf_Spot"), so the leftmost
+# match is the category the ordered checks pick.
+_CATEGORY_RE = re.compile(r'healthy|blight|spot|rust|mildew', re.IGNORECASE)
+
+def _classify(disease_type: str) -> str:
+    """Map a disease name to its recommendation category"""
+    match = _CATEGORY_RE.search(disease_type)
+    return match.group(0).lower() if match else 'other'
+
+# Class ids map to fixed names, so predictions look their category up instead of classifying
+_CATEGORY_BY_IDX = tuple(_classify(disease) for disease in _DISEASE_BY_IDX)
+
+# Class indices per plant as index arrays, for a single fancy-indexed argmax
+_PLANT_CLASS_INDICES = {plant: np.asarray(indices, dtype=np.intp) for plant, indices in PLANT_TYPES.items()}
+
+# Decoded ID tokens keyed by a BLAKE2 digest of the raw token, so repeat requests
+# skip the signature check; entries are only reused while the token is still valid
+_token_cache = TTLCache(maxsize=4096, ttl=300)
+_token_cache_lock = threading.Lock()
+TOKEN_EXPIRY_MARGIN = 30  # seconds
+
 def verify_firebase_token(token: str) -> Optional[Dict]:
     """Verify Firebase ID token"""
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        cached_token = _token_cache.get(cache_key)
+    if cached_token is not None and cached_token.get('exp', 0) > time.time() + TOKEN_EXPIRY_MARGIN:
+        return cached_token
+    
     try:
         decoded_token = auth.verify_id_token(token)
-        return decoded_token
     except Exception as e:
         logger.error(f"Token verification failed: {e}")
         return None
+    
+    with _token_cache_lock:
+        _token_cache[cache_key] = decoded_token
+    return decoded_token
 
 def require_auth(f):
     """Decorator to require Firebase authentication"""
@@ -208,33 +363,45 @@ def require_auth(f):
     
     return decorated_function
 
-def preprocess_image(image_data: bytes, target_size: Tuple[int, int] = (160, 160)) -> np.ndarray:
-    """Preprocess image for model prediction"""
+# uint8 pixel -> normalized float32, so normalization is a single table lookup per pixel
+_NORM_LUT = np.arange(256, dtype=np.float32) / np.float32(255.0)
+
+def decode_image(image_buffer: np.ndarray) -> np.ndarray:
+    """Decode an encoded image held in a uint8 buffer into a BGR array"""
+    image = cv2.imdecode(image_buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image format: could not decode image data")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Original image size: {image.shape[1]}x{image.shape[0]}")
+    return image
+
+def resize_to_rgb(image: np.ndarray, target_size: Tuple[int, int] = (160, 160)) -> np.ndarray:
+    """Resize a decoded BGR image to a uint8 RGB array"""
+    # INTER_AREA (box average) is the fast, alias-free filter for downscaling phone
+    # photos; for the rare upload smaller than the model input it degrades to a slower
+    # nearest-neighbour-like path, so use bilinear there
+    height, width = image.shape[:2]
+    if width >= target_size[0] and height >= target_size[1]:
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LINEAR
+    # Resize first so the color conversion only touches target_size pixels
+    image = cv2.resize(image, target_size, interpolation=interpolation)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+def preprocess_array(image: np.ndarray, target_size: Tuple[int, int] = (160, 160)) -> np.ndarray:
+    """Preprocess a decoded BGR image for model prediction"""
     try:
         # Log preprocessing steps for debugging
-        logger.info("Starting image preprocessing...")
-        
-        # Load image from bytes
-        image = Image.open(io.BytesIO(image_data))
-        logger.info(f"Original image size: {image.size}, mode: {image.mode}")
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            logger.info("Converted image to RGB mode")
+        logger.debug("Starting image preprocessing...")
+        image = resize_to_rgb(image, target_size)
         
-        # Resize image
-        image = image.resize(target_size, Image.Resampling.LANCZOS)
-        logger.info(f"Resized image to {target_size}")
-        
-        # Convert to numpy array and normalize
-        image_array = np.array(image)
-        logger.info(f"Image array shape before normalization: {image_array.shape}")
-        image_array = image_array.astype(np.float32) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        logger.info(f"Final preprocessed array shape: {image_array.shape}")
+        # Normalize via the uint8 -> float32 lookup table straight into the batched buffer
+        width, height = target_size
+        image_array = np.empty((1, height, width, 3), dtype=np.float32)
+        np.take(_NORM_LUT, image, out=image_array[0])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Final preprocessed array shape: {image_array.shape}")
         
         return image_array
     except Exception as e:
@@ -243,54 +410,132 @@ def preprocess_image(image_data: bytes, target_size: Tuple[int, int] = (160, 160
         logger.error(traceback.format_exc())
         raise ValueError(f"Invalid image format: {str(e)}")
 
-def predict_disease(image_data: bytes, plant_type: str = None) -> Dict:
-    """Predict plant disease from image"""
+def preprocess_image(image_data: bytes, target_size: Tuple[int, int] = (160, 160)) -> np.ndarray:
+    """Preprocess encoded image bytes for model prediction"""
+    return preprocess_array(decode_image(np.frombuffer(image_data, np.uint8)), target_size)
+
+def quantize_pixels(image: np.ndarray) -> np.ndarray:
+    """Map uint8 RGB pixels straight into the int8 model input, skipping float normalization"""
+    image_array = np.empty((1,) + image.shape, dtype=np.int8)
+    if _input_quant_lut is None:
+        # scale 1/255, zero point -128: int8 = pixel - 128, i.e. flip the sign bit
+        np.bitwise_xor(image, np.uint8(0x80), out=image_array[0].view(np.uint8))
+    else:
+        np.take(_input_quant_lut, image, out=image_array[0])
+    return image_array
+
+def preprocess_for_model(image: np.ndarray) -> np.ndarray:
+    """Preprocess a decoded BGR image into the dtype the loaded model consumes"""
+    if interpreter is not None and input_details[0]['dtype'] == np.int8:
+        try:
+            return quantize_pixels(resize_to_rgb(image))
+        except Exception as e:
+            logger.error(f"Image preprocessing error: {e}")
+            raise ValueError(f"Invalid image format: {str(e)}")
+    return preprocess_array(image)
+
+def run_tflite_inference(images: List[np.ndarray]) -> np.ndarray:
+    """Run the TFLite model on preprocessed (1, H, W, 3) images and return dequantized scores"""
+    global input_details, output_details
+    batch_shape = (len(images),) + images[0].shape[1:]
+    if tuple(input_details[0]['shape']) != batch_shape:
+        # Batch size changed, resize the input tensor and re-plan the arena
+        interpreter.resize_tensor_input(input_details[0]['index'], batch_shape)
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+    input_detail = input_details[0]
+    output_detail = output_details[0]
+
+    # Quantize float input into the model's int8 domain (int8 input is already quantized)
+    scale, zero_point = input_detail['quantization']
+    if input_detail['dtype'] == np.int8 and images[0].dtype != np.int8:
+        images = [np.clip(np.round(image / scale + zero_point), -128, 127).astype(np.int8) for image in images]
+
+    # Assemble the batch directly in the interpreter's input tensor instead of
+    # concatenating and then having set_tensor() copy it in
+    input_tensor = _input_tensor()
+    np.concatenate(images, out=input_tensor)
+    del input_tensor  # invoke() refuses to run while views of internal buffers are alive
+    interpreter.invoke()
+    output = interpreter.get_tensor(output_detail['index'])
+
+    # Dequantize back to probabilities before argmax/confidence
+    scale, zero_point = output_detail['quantization']
+    if output_detail['dtype'] == np.int8:
+        output = (output.astype(np.float32) - zero_point) * scale
+    return output
+
+def run_inference_batch(images: List[np.ndarray]) -> np.ndarray:
+    """Run whichever model is loaded on a list of preprocessed (1, H, W, 3) images"""
+    if interpreter is not None:
+        return run_tflite_inference(images)
+    return keras_infer(tf.constant(np.concatenate(images))).numpy()
+
+_batcher = MicroBatcher(run_inference_batch, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+
+def ensure_worker_model() -> bool:
+    """Load the model if needed and rebuild an interpreter inherited across fork; False if unusable"""
+    global _MODEL_READY
+    with _model_lock:
+        if not _MODEL_READY and model is None and interpreter is None:
+            logger.info("Model not loaded, attempting to load model before prediction...")
+            _MODEL_READY = load_model()
+        elif _MODEL_READY and interpreter is not None and _interpreter_pid != os.getpid():
+            # Built in the master before fork: its kernel thread pool did not survive
+            # the fork, so rebuild it here over the same shared mmap'd FlatBuffer
+            try:
+                _MODEL_READY = load_tflite_model()
+            except Exception as e:
+                logger.error(f"❌ Error rebuilding TFLite model: {str(e)}")
+                _MODEL_READY = False
+            if not _MODEL_READY:
+                logger.error(f"❌ Worker {os.getpid()} could not rebuild the TFLite model")
+    return _MODEL_READY
+
+def predict_disease(image: np.ndarray, plant_type: str = None) -> Dict:
+    """Predict plant disease from a decoded BGR image"""
     try:
-        logger.info("Starting disease prediction...")
-        if model is None:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug("Starting disease prediction...")
+        if model is None and interpreter is None:
             logger.error("Model not loaded")
             raise ValueError("Model not loaded")
         
-        # Log model input requirements
-        logger.info(f"Model input shape: {model.input_shape}")
-        logger.info(f"Model output shape: {model.output_shape}")
-        
         # Preprocess image
-        logger.info("Preprocessing image...")
-        processed_image = preprocess_image(image_data)
-        logger.info(f"Preprocessed image shape: {processed_image.shape}")
+        logger.debug("Preprocessing image...")
+        processed_image = preprocess_for_model(image)
+        if debug:
+            logger.debug(f"Preprocessed image shape: {processed_image.shape}")
         
         # Make prediction
-        logger.info("Running model prediction...")
-        predictions = model.predict(processed_image, verbose=0)
-        logger.info(f"Raw predictions shape: {predictions.shape}")
-        logger.info(f"Raw prediction values: {predictions[0]}")
+        logger.debug("Running model prediction...")
+        predictions = _batcher.submit(processed_image)
+        if debug:
+            logger.debug(f"Raw predictions shape: {predictions.shape}")
+            logger.debug(f"Raw prediction values: {predictions[0]}")
         
-        predicted_class_idx = np.argmax(predictions[0])
+        predicted_class_idx = int(np.argmax(predictions[0]))
         confidence = float(predictions[0][predicted_class_idx])
-        logger.info(f"Predicted class index: {predicted_class_idx}, confidence: {confidence}")
-        
-        # Get disease information
-        disease_name = DISEASE_CLASSES.get(predicted_class_idx, 'Unknown')
-        plant_name = disease_name.split('___')[0]
-        disease_type = disease_name.split('___')[1] if '___' in disease_name else 'healthy'
-        logger.info(f"Identified disease: {disease_name}")
+        if debug:
+            logger.debug(f"Predicted class index: {predicted_class_idx}, confidence: {confidence}")
+            logger.debug(f"Identified disease: {DISEASE_CLASSES[predicted_class_idx]}")
         
         # Filter by plant type if specified
         if plant_type and plant_type.lower() in PLANT_TYPES:
             valid_indices = PLANT_TYPES[plant_type.lower()]
             if predicted_class_idx not in valid_indices:
                 # Find the best prediction within the plant type
-                plant_predictions = predictions[0][valid_indices]
-                best_idx = np.argmax(plant_predictions)
-                predicted_class_idx = valid_indices[best_idx]
-                confidence = float(plant_predictions[best_idx])
-                disease_name = DISEASE_CLASSES[predicted_class_idx]
-                plant_name = disease_name.split('___')[0]
-                disease_type = disease_name.split('___')[1] if '___' in disease_name else 'healthy'
+                class_indices = _PLANT_CLASS_INDICES[plant_type.lower()]
+                plant_scores = predictions[0][class_indices]
+                best = int(np.argmax(plant_scores))
+                predicted_class_idx = int(class_indices[best])
+                confidence = float(plant_scores[best])
         
-        # Determine if plant is healthy
-        is_healthy = 'healthy' in disease_type.lower()
+        # Get disease information
+        plant_name = _PLANT_BY_IDX[predicted_class_idx]
+        disease_type = _DISEASE_BY_IDX[predicted_class_idx]
+        is_healthy = _IS_HEALTHY_BY_IDX[predicted_class_idx]
         
         # Get severity level
         if is_healthy:
@@ -303,7 +548,7 @@ def predict_disease(image_data: bytes, plant_type: str = None) -> Dict:
             severity = 'low'
         
         # Get recommendations
-        recommendations = get_recommendations(disease_type, severity)
+        recommendations = recommendations_for(_CATEGORY_BY_IDX[predicted_class_idx], severity)
         
         return {
             'plant_name': plant_name,
@@ -319,73 +564,81 @@ def predict_disease(image_data: bytes, plant_type: str = None) -> Dict:
         logger.error(f"Prediction error: {e}")
         raise ValueError(f"Prediction failed: {str(e)}")
 
-def get_recommendations(disease_type: str, severity: str) -> List[str]:
-    """Get treatment recommendations based on disease type and severity"""
-    recommendations = []
-    
-    if 'healthy' in disease_type.lower():
-        recommendations = [
-            "Continue current care practices",
-            "Monitor for any changes in plant appearance",
-            "Maintain proper watering and fertilization schedule",
-            "Ensure adequate sunlight and air circulation"
-        ]
-    elif 'blight' in disease_type.lower():
-        recommendations = [
-            "Remove and destroy affected plant parts immediately",
-            "Apply copper-based fungicide",
-            "Improve air circulation around plants",
-            "Avoid overhead watering",
-            "Apply preventive fungicide treatments"
-        ]
-    elif 'spot' in disease_type.lower():
-        recommendations = [
-            "Remove infected leaves and dispose properly",
-            "Apply fungicide containing chlorothalonil or mancozeb",
-            "Water at soil level to avoid wetting foliage",
-            "Ensure proper spacing between plants",
-            "Apply mulch to prevent soil splash"
-        ]
-    elif 'rust' in disease_type.lower():
-        recommendations = [
-            "Remove infected plant material",
-            "Apply sulfur-based fungicide",
-            "Improve air circulation",
-            "Avoid overhead irrigation",
-            "Consider resistant varieties for future plantings"
-        ]
-    elif 'mildew' in disease_type.lower():
-        recommendations = [
-            "Increase air circulation",
-            "Apply fungicide containing myclobutanil or propiconazole",
-            "Remove affected plant parts",
-            "Reduce humidity around plants",
-            "Apply preventive treatments during humid periods"
-        ]
-    else:
-        recommendations = [
-            "Consult with local agricultural extension service",
-            "Remove affected plant parts",
-            "Apply appropriate fungicide or bactericide",
-            "Improve growing conditions",
-            "Consider resistant varieties"
-        ]
-    
-    # Add severity-specific recommendations
+# Base treatment recommendations per disease category, checked in this order
+_CATEGORY_RECOMMENDATIONS = {
+    'healthy': (
+        "Continue current care practices",
+        "Monitor for any changes in plant appearance",
+        "Maintain proper watering and fertilization schedule",
+        "Ensure adequate sunlight and air circulation"
+    ),
+    'blight': (
+        "Remove and destroy affected plant parts immediately",
+        "Apply copper-based fungicide",
+        "Improve air circulation around plants",
+        "Avoid overhead watering",
+        "Apply preventive fungicide treatments"
+    ),
+    'spot': (
+        "Remove infected leaves and dispose properly",
+        "Apply fungicide containing chlorothalonil or mancozeb",
+        "Water at soil level to avoid wetting foliage",
+        "Ensure proper spacing between plants",
+        "Apply mulch to prevent soil splash"
+    ),
+    'rust': (
+        "Remove infected plant material",
+        "Apply sulfur-based fungicide",
+        "Improve air circulation",
+        "Avoid overhead irrigation",
+        "Consider resistant varieties for future plantings"
+    ),
+    'mildew': (
+        "Increase air circulation",
+        "Apply fungicide containing myclobutanil or propiconazole",
+        "Remove affected plant parts",
+        "Reduce humidity around plants",
+        "Apply preventive treatments during humid periods"
+    ),
+    'other': (
+        "Consult with local agricultural extension service",
+        "Remove affected plant parts",
+        "Apply appropriate fungicide or bactericide",
+        "Improve growing conditions",
+        "Consider resistant varieties"
+    )
+}
+
+def _with_severity(recommendations: Tuple[str, ...], severity: str) -> Tuple[str, ...]:
+    """Add severity-specific recommendations around the base list"""
     if severity == 'high':
-        recommendations.insert(0, "URGENT: Immediate action required")
-        recommendations.append("Consider removing severely affected plants")
-    elif severity == 'medium':
-        recommendations.insert(0, "Moderate intervention needed")
-    
+        return ("URGENT: Immediate action required",) + recommendations + ("Consider removing severely affected plants",)
+    if severity == 'medium':
+        return ("Moderate intervention needed",) + recommendations
     return recommendations
 
+# Every (category, severity) combination is built once at import
+_RECOMMENDATIONS = {
+    (category, severity): _with_severity(recommendations, severity)
+    for category, recommendations in _CATEGORY_RECOMMENDATIONS.items()
+    for severity in ('high', 'medium', 'low')
+}
+
+def recommendations_for(category: str, severity: str) -> Tuple[str, ...]:
+    """Get treatment recommendations for a disease category and severity"""
+    # Any severity other than high/medium gets the unprefixed list
+    return _RECOMMENDATIONS.get((category, severity)) or _RECOMMENDATIONS[(category, 'low')]
+
+def get_recommendations(disease_type: str, severity: str) -> Tuple[str, ...]:
+    """Get treatment recommendations based on an arbitrary disease name and severity"""
+    return recommendations_for(_classify(disease_type), severity)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None,
+        'model_loaded': _MODEL_READY,
         'firebase_connected': db is not None,
         'timestamp': datetime.utcnow().isoformat()
     })
@@ -475,18 +728,48 @@ def register():
         logger.error(f"Registration error: {e}")
         return jsonify({'error': 'Registration failed'}), 500
 
+# Firestore history writes run off the request thread; beyond this many pending, drop them
+HISTORY_WRITE_QUEUE_SIZE = int(os.getenv('HISTORY_WRITE_QUEUE_SIZE', 256))
+_history_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='history-writer')
+_history_slots = threading.BoundedSemaphore(HISTORY_WRITE_QUEUE_SIZE)
+
+def _save_prediction(user_id: str, plant_type: str, result: Dict, filename: str, created_at: datetime):
+    """Write one prediction to the user's Firestore history"""
+    try:
+        prediction_ref = db.collection('predictions').document()
+        prediction_ref.set({
+            'user_id': user_id,
+            'plant_type': plant_type,
+            'result': dict(result, recommendations=list(result['recommendations'])),
+            'image_filename': filename,
+            'created_at': created_at
+        })
+    except Exception as e:
+        logger.error(f"Failed to save prediction to Firestore: {e}")
+    finally:
+        _history_slots.release()
+
+def queue_prediction_save(user_id: str, plant_type: str, result: Dict, filename: str):
+    """Save a prediction in the background so the response doesn't wait on Firestore"""
+    if not _history_slots.acquire(blocking=False):
+        logger.warning(f"History write queue full, dropping prediction for user {user_id}")
+        return
+    try:
+        _history_executor.submit(_save_prediction, user_id, plant_type, result, filename, datetime.utcnow())
+    except RuntimeError as e:
+        _history_slots.release()
+        logger.error(f"Failed to queue prediction save: {e}")
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Predict plant disease from uploaded image"""
     try:
-        # Ensure model is loaded (try to load if not)
-        if model is None:
-            logger.info("Model not loaded, attempting to load model before prediction...")
-            if not load_model():
-                return jsonify({
-                    'error': 'Model not available', 
-                    'details': 'Could not load the model.'
-                }), 500
+        # Ensure model is loaded (try to load if not) and usable in this worker
+        if not ensure_worker_model():
+            return jsonify({
+                'error': 'Model not available', 
+                'details': 'Could not load the model.'
+            }), 503
         # Check if image file is present
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
@@ -503,30 +786,20 @@ def predict():
                 file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
             return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG, WEBP are allowed'}), 400
         
-        # Read image data
-        image_data = file.read()
+        # Read image data into a zero-copy uint8 view for cv2
+        image_buffer = np.frombuffer(file.stream.read(), np.uint8)
         
         # Validate image size
-        if len(image_data) > 16 * 1024 * 1024:  # 16MB
+        if image_buffer.size > 16 * 1024 * 1024:  # 16MB
             return jsonify({'error': 'Image too large. Maximum size is 16MB'}), 400
         
         try:
             # Make prediction
-            result = predict_disease(image_data, plant_type)
+            result = predict_disease(decode_image(image_buffer), plant_type)
             
             # Save prediction to user history if Firestore is available and user is authenticated
             if db and hasattr(g, 'user') and g.user and g.user.get('uid') != 'anonymous':
-                try:
-                    prediction_ref = db.collection('predictions').document()
-                    prediction_ref.set({
-                        'user_id': g.user['uid'],
-                        'plant_type': plant_type,
-                        'result': result,
-                        'image_filename': secure_filename(file.filename),
-                        'created_at': datetime.utcnow()
-                    })
-                except Exception as e:
-                    logger.error(f"Failed to save prediction to Firestore: {e}")
+                queue_prediction_save(g.user['uid'], plant_type, result, secure_filename(file.filename))
             
             return jsonify({
                 'success': True,
@@ -560,10 +833,11 @@ def predict():
 @app.route('/api/user/history', methods=['GET'])
 @require_auth
 def get_user_history():
-    """Get user's prediction history"""
+    """Get user's prediction history (send back `next_cursor` as `?cursor=` for the next page)"""
     try:
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
+        cursor = request.args.get('cursor')
         
         if not db:
             return jsonify({'error': 'Database not available'}), 500
@@ -573,17 +847,15 @@ def get_user_history():
         query = predictions_ref.where('user_id', '==', g.user['uid']).order_by('created_at', direction=firestore.Query.DESCENDING)
         
         # Pagination
-        start_after = None
-        if page > 1:
-            # Get the last document from previous page
-            prev_query = query.limit((page - 1) * limit)
-            prev_docs = prev_query.stream()
-            prev_docs_list = list(prev_docs)
-            if prev_docs_list:
-                start_after = prev_docs_list[-1]
-        
-        if start_after:
-            query = query.start_after(start_after)
+        if cursor:
+            # Resume right after the last document of the previous page
+            cursor_doc = predictions_ref.document(cursor).get()
+            if not cursor_doc.exists or cursor_doc.get('user_id') != g.user['uid']:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.start_after(cursor_doc)
+        elif page > 1:
+            # Legacy page numbers: let Firestore skip server-side in the same query
+            query = query.offset((page - 1) * limit)
         
         query = query.limit(limit)
         docs = query.stream()
@@ -598,7 +870,8 @@ def get_user_history():
             'success': True,
             'predictions': predictions,
             'page': page,
-            'limit': limit
+            'limit': limit,
+            'next_cursor': predictions[-1]['id'] if len(predictions) == limit else None
         })
     
     except Exception as e:
@@ -673,7 +946,7 @@ def get_plants_info():
 
 if __name__ == '__main__':
     # Load model on startup
-    load_model()
+    _MODEL_READY = load_model()
     
     # Run the app
     port = int(os.getenv('PORT', 3001))  # Changed default port to 3001
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Convert a Keras plant disease model to INT8 and FP16 TFLite FlatBuffers
+
+Outputs are written next to the Keras model as <name>_int8.tflite and <name>_fp16.tflite.
+convert_fp32 is used by setup_model.py for the unquantized export.
+"""
+
+import os
+import sys
+import numpy as np
+import tensorflow as tf
+import cv2
+
+KERAS_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'plantdiseasedetection.keras')
+NUM_CALIBRATION_IMAGES = 100
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+def tflite_path(keras_path, variant):
+    """Path of a TFLite variant ('int8' or 'fp16') for the given Keras model"""
+    return f"{os.path.splitext(keras_path)[0]}_{variant}.tflite"
+
+def load_calibration_images(image_dir, input_size):
+    """Load up to NUM_CALIBRATION_IMAGES training images, preprocessed like the API does"""
+    images = []
+    for root, _, files in os.walk(image_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(root, name), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            # Same filters as the API's resize: INTER_AREA down, INTER_LINEAR when upscaling,
+            # so calibration sees the pixel distribution served at inference time
+            height, width = image.shape[:2]
+            if width >= input_size[0] and height >= input_size[1]:
+                interpolation = cv2.INTER_AREA
+            else:
+                interpolation = cv2.INTER_LINEAR
+            image = cv2.cvtColor(cv2.resize(image, input_size, interpolation=interpolation), cv2.COLOR_BGR2RGB)
+            images.append(image.astype(np.float32) / 255.0)
+            if len(images) >= NUM_CALIBRATION_IMAGES:
+                return images
+    return images
+
+def write_tflite(tflite_model, output_path, label):
+    """Write a converted FlatBuffer to disk"""
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"💾 {label} model saved to: {output_path} ({len(tflite_model) / 1024 / 1024:.1f} MB)")
+    return output_path
+
+def convert_fp32(model, output_path):
+    """Plain float32 FlatBuffer: Keras numerics without the Keras load cost"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    return write_tflite(converter.convert(), output_path, 'FP32')
+
+def convert_int8(model, images, output_path):
+    """Run post-training full-integer quantization calibrated on (H, W, 3) images and write the .tflite file"""
+    def representative_dataset():
+        for image in images:
+            yield [np.expand_dims(image, axis=0)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return write_tflite(converter.convert(), output_path, 'INT8')
+
+def convert_fp16(model, output_path):
+    """Store weights as float16 (float32 compute); the fallback where int8 kernels regress"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return write_tflite(converter.convert(), output_path, 'FP16')
+
+def convert(image_dir, keras_path=KERAS_MODEL_PATH):
+    """Produce both TFLite variants; the API picks between them at load time"""
+    print(f"🤖 Loading Keras model from: {keras_path}")
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    height, width = model.input_shape[1:3]
+    images = load_calibration_images(image_dir, (width, height))
+    if not images:
+        raise ValueError(f"No calibration images found in {image_dir}")
+    print(f"🎯 Calibrating with {len(images)} images from {image_dir}")
+    return (convert_int8(model, images, tflite_path(keras_path, 'int8')),
+            convert_fp16(model, tflite_path(keras_path, 'fp16')))
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: python {os.path.basename(__file__)} <training-images-dir> [keras-model]")
+        sys.exit(1)
+    try:
+        convert(*sys.argv[1:])
+        print("✅ Conversion completed successfully!")
+    except Exception as e:
+        print(f"\n❌ Conversion failed: {e}")
+        sys.exit(1)
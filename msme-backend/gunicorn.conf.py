@@ -10,12 +10,23 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
 backlog = 2048
 
 # Worker processes
-workers = 2  # Conservative for 512MB RAM
-worker_class = "sync"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))  # Default is conservative for 512MB RAM
+worker_class = "gthread"
+threads = 8  # Handlers block on the inference batcher, so a worker can hold several requests
 worker_connections = 1000
 timeout = 120  # Increased timeout for ML model loading
 keepalive = 2
 
+# Split the cores between workers so the TF/TFLite/BLAS thread pools of the two
+# workers don't oversubscribe them. Set in the environment before the app, and so
+# TensorFlow, is imported (preload_app imports it in the master).
+cpu_threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+    os.environ.setdefault(var, str(cpu_threads_per_worker))
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+# A worker never has more than `threads` requests in flight, so no batch can be larger
+os.environ.setdefault('MB_MAX_BATCH', str(threads))
+
 # Restart workers after this many requests, to help control memory usage
 max_requests = 1000
 max_requests_jitter = 100
@@ -36,4 +47,4 @@ enable_stdio_inheritance = True
 # Security
 limit_request_line = 4096
 limit_request_fields = 100
-limit_request_field_size = 8192
\ No newline at end of file
+limit_request_field_size = 8192
@@ -1,27 +1,19 @@
 import os
-import io
-import json
 import logging
+import random
+import sys
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import IO, Dict, List, Optional, Tuple
 import numpy as np
-from PIL import Image
 import tensorflow as tf
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import orjson
 from werkzeug.utils import secure_filename
 import cv2
-
-# Custom JSON encoder to handle NumPy types
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super(NumpyEncoder, self).default(obj)
+from serving import MicroBatcher, OrjsonProvider, load_xnnpack_delegate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,15 +24,57 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'plant-disease-secret-key')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Configure JSON encoder to handle NumPy types
-app.json_encoder = NumpyEncoder
+# Serialize JSON (including NumPy types) with orjson
+app.json = OrjsonProvider(app)
 
 # Enable CORS
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
 # Global variables
 model = None
+interpreter = None
+input_details = None
+output_details = None
+_model_pid = None
+keras_infer = None
+_MODEL_READY = False
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'plant_disease_model.h5')
+# TFLite exports of the model; generate with: python convert_to_tflite.py <images-dir> plant_disease_model.h5
+TFLITE_MODEL_PATHS = {
+    'fp16': os.path.join(os.path.dirname(__file__), 'plant_disease_model_fp16.tflite'),
+    'int8': os.path.join(os.path.dirname(__file__), 'plant_disease_model_int8.tflite'),
+    'fp32': os.path.join(os.path.dirname(__file__), 'plant_disease_model.tflite')
+}
+# FP16 keeps float accuracy at half the weight size; INT8 is smaller/faster but can lose
+# accuracy; FP32 is the unquantized export written by setup_model.py
+MODEL_PRECISION = os.getenv('MODEL_PRECISION', 'fp16').lower()
+XNNPACK_DELEGATE_PATH = os.getenv('XNNPACK_DELEGATE_PATH', 'libtensorflowlite_xnnpack_delegate.so')
+# gunicorn.conf.py sets OMP_NUM_THREADS to each worker's share of the cores
+TFLITE_NUM_THREADS = int(os.getenv('OMP_NUM_THREADS', os.cpu_count()))
+
+# Keep TF (Keras fallback), TFLite and OpenCV from each sizing a pool to every core.
+# Preprocessing handles one image per request thread, so OpenCV gets no pool of its own.
+cv2.setNumThreads(1)
+try:
+    if 'TF_NUM_INTRAOP_THREADS' not in os.environ:
+        tf.config.threading.set_intra_op_parallelism_threads(TFLITE_NUM_THREADS)
+    if 'TF_NUM_INTEROP_THREADS' not in os.environ:
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+except RuntimeError:
+    # TF was already initialized by the importer; its pools keep their current size
+    logger.warning("TensorFlow already initialized, thread pool sizes left unchanged")
+# Per-thread (1, H, W, 3) float32 input batch, reused across requests
+_input_buffers = threading.local()
+
+# Micro-batching: concurrent predict requests share one interpreter invoke
+# gunicorn.conf.py sets MB_MAX_BATCH to the worker's thread count, so a full worker flushes at once
+MB_MAX_BATCH = int(os.getenv('MB_MAX_BATCH', 8))
+MB_MAX_LATENCY_MS = float(os.getenv('MB_MAX_LATENCY_MS', 20))
+# Serializes model (re)loads across a worker's request threads
+_model_lock = threading.Lock()
+
+# (monotonic time, ISO string) of the last formatted response timestamp
+_cached_timestamp = (float('-inf'), '')
 
 # Disease classes mapping for the 5 specified plants
 DISEASE_CLASSES = {
@@ -89,6 +123,18 @@ PLANT_TYPES = {
     'potato': [12, 13, 14],
     'tomato': [15, 16, 17, 18, 19, 20, 21, 22, 23, 24]
 }
+_ALL_CLASS_IDS = tuple(DISEASE_CLASSES)
+
+# Per-class plant name, disease name and health flag, indexed by class id
+_PLANT_BY_IDX = tuple(name.split('___')[0] for name in DISEASE_CLASSES.values())
+_DISEASE_BY_IDX = tuple(name.split('___')[1] if '___' in name else 'Unknown' for name in DISEASE_CLASSES.values())
+_IS_HEALTHY_BY_IDX = tuple('healthy' in disease.lower() for disease in _DISEASE_BY_IDX)
+
+_SUPPORTED_TYPES_LIST = list(PLANT_TYPES)
+
+# Accepted upload formats
+_ALLOWED_EXT = frozenset({'png', 'jpg', 'jpeg', 'webp', 'bmp'})
+_ALLOWED_EXT_LIST = sorted(_ALLOWED_EXT)
 
 def create_simple_cnn_model():
     """Create a simple CNN model for plant disease classification"""
@@ -123,15 +169,58 @@ def create_simple_cnn_model():
         logger.error(f"Error creating CNN model: {e}")
         return None
 
-def load_model():
-    """Load or create the plant disease detection model"""
-    global model
+def find_tflite_model() -> Optional[str]:
+    """Path of the TFLite model for MODEL_PRECISION, falling back to the other variant"""
+    preferred = TFLITE_MODEL_PATHS.get(MODEL_PRECISION)
+    if preferred is None:
+        logger.warning(f"Unknown MODEL_PRECISION '{MODEL_PRECISION}', expected one of {list(TFLITE_MODEL_PATHS)}")
+    for path in [preferred] + list(TFLITE_MODEL_PATHS.values()):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def build_keras_inference_fn(keras_model):
+    """Trace the Keras forward pass once for a fixed input signature and warm it up"""
+    @tf.function(input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.float32)])
+    def infer(x):
+        return keras_model(x, training=False)
+    infer(tf.zeros((1, 224, 224, 3)))
+    return infer
+
+def load_model(bootstrap: bool = False, defer_keras: bool = False) -> bool:
+    """Load the model (untrained CNN only when bootstrapping); defer_keras leaves a .h5 model to ensure_worker_model()"""
+    global model, interpreter, input_details, output_details, _model_pid, keras_infer
     try:
+        # Prefer a TFLite model
+        tflite_path = find_tflite_model()
+        if tflite_path:
+            logger.info(f"Loading TFLite model from: {tflite_path}")
+            # FP16 weights are dequantized once at load, so the input tensor stays float32
+            interpreter = tf.lite.Interpreter(
+                model_path=tflite_path,
+                num_threads=TFLITE_NUM_THREADS,
+                experimental_delegates=load_xnnpack_delegate(XNNPACK_DELEGATE_PATH, TFLITE_NUM_THREADS) or None
+            )
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
+            _model_pid = os.getpid()
+            logger.info(f"Model input shape: {input_details[0]['shape']}")
+            logger.info(f"Model output shape: {output_details[0]['shape']}")
+            return True
+        
         # Try to load existing model
-        if os.path.exists(MODEL_PATH):
+        if os.path.exists(MODEL_PATH) and defer_keras:
+            logger.info(f"Found model at {MODEL_PATH}; deferring the load to the serving process")
+            return True
+        elif os.path.exists(MODEL_PATH):
             logger.info(f"Loading model from: {MODEL_PATH}")
             model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+            keras_infer = build_keras_inference_fn(model)
             logger.info("Model loaded successfully")
+        elif not bootstrap:
+            logger.error(f"No model found at {MODEL_PATH} or any TFLite path (start with --bootstrap-model to create one)")
+            return False
         else:
             # Create a new model if none exists
             logger.info("Model file not found, creating a new model...")
@@ -143,6 +232,7 @@ def load_model():
                 return False
         
         if model:
+            _model_pid = os.getpid()
             logger.info(f"Model input shape: {model.input_shape}")
             logger.info(f"Model output shape: {model.output_shape}")
             return True
@@ -151,31 +241,33 @@ def load_model():
         logger.error(f"Error loading model: {e}")
         return False
 
-def preprocess_image(image_data: bytes, target_size: Tuple[int, int] = (224, 224)) -> np.ndarray:
-    """Preprocess image for model prediction"""
+def preprocess_image(file_stream: IO[bytes], target_size: Tuple[int, int] = (224, 224)) -> np.ndarray:
+    """Preprocess image for model prediction; the returned batch is reused by the next call on this thread"""
     try:
-        logger.info("Starting image preprocessing...")
-        
-        # Load image from bytes
-        image = Image.open(io.BytesIO(image_data))
-        logger.info(f"Original image size: {image.size}, mode: {image.mode}")
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            logger.info("Converted image to RGB mode")
-        
-        # Resize image
-        image = image.resize(target_size, Image.Resampling.LANCZOS)
-        logger.info(f"Resized image to {target_size}")
-        
-        # Convert to numpy array and normalize
-        image_array = np.array(image)
-        image_array = image_array.astype(np.float32) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        logger.info(f"Final preprocessed array shape: {image_array.shape}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug("Starting image preprocessing...")
+        
+        # Decode straight from the upload stream (IMREAD_COLOR drops alpha and expands grayscale)
+        image = cv2.imdecode(np.frombuffer(file_stream.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image")
+        if debug:
+            logger.debug(f"Original image size: {image.shape[1]}x{image.shape[0]}")
+        
+        # Resize with area averaging, then OpenCV's BGR to the RGB order the model expects
+        image = cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if debug:
+            logger.debug(f"Resized image to {target_size}")
+        
+        # Normalize straight into this thread's preallocated batch of one
+        shape = (1, target_size[1], target_size[0], 3)
+        image_array = getattr(_input_buffers, 'batch', None)
+        if image_array is None or image_array.shape != shape:
+            image_array = _input_buffers.batch = np.empty(shape, dtype=np.float32)
+        np.multiply(image, np.float32(1.0 / 255.0), out=image_array[0], casting='unsafe')
+        if debug:
+            logger.debug(f"Final preprocessed array shape: {image_array.shape}")
         
         return image_array
         
@@ -183,267 +275,339 @@ def preprocess_image(image_data: bytes, target_size: Tuple[int, int] = (224, 224
         logger.error(f"Image preprocessing error: {e}")
         raise ValueError(f"Invalid image format: {str(e)}")
 
+_HEALTHY_CARE = (
+    "🌱 Continue current care practices",
+    "👀 Monitor for any changes in plant appearance",
+    "💧 Maintain proper watering schedule",
+    "☀️ Ensure adequate sunlight exposure",
+    "🌬️ Provide good air circulation"
+)
+
+# Severity-based urgency; anything other than high/medium gets the low prefix
+_SEVERITY = {
+    'high': ("🚨 URGENT: Immediate action required!",),
+    'medium': ("⚠️ Moderate intervention needed",),
+    'low': ("ℹ️ Early stage treatment recommended",)
+}
+
+# Disease-specific recommendations, in the order the keyword checks take precedence
+_RECO_TABLE = {
+    'scab': (
+        "🍎 Apple Scab Treatment:",
+        "🍂 Remove fallen leaves and infected fruit immediately",
+        "💊 Apply fungicide containing captan or myclobutanil",
+        "✂️ Prune to improve air circulation",
+        "🚫 Avoid overhead watering",
+        "🔄 Rotate fungicide types to prevent resistance"
+    ),
+    'black_rot': (
+        "🦠 Black Rot Treatment:",
+        "✂️ Prune out infected branches and cankers",
+        "🗑️ Remove and destroy all infected plant material",
+        "💊 Apply copper-based fungicide",
+        "🌡️ Improve air circulation and reduce humidity",
+        "🚫 Avoid watering late in the day"
+    ),
+    # Also covers cedar apple rust and common rust
+    'rust': (
+        "🦀 Rust Disease Treatment:",
+        "🌲 Remove nearby juniper plants if possible",
+        "💊 Apply sulfur-based fungicide",
+        "🍂 Remove infected leaves immediately",
+        "🌬️ Ensure good air circulation",
+        "🚫 Avoid overhead irrigation"
+    ),
+    'leaf_spot': (
+        "🌽 Corn Leaf Spot Treatment:",
+        "🔄 Implement crop rotation",
+        "💊 Apply fungicide containing strobilurin",
+        "🌱 Plant resistant corn varieties",
+        "🗑️ Remove crop debris after harvest",
+        "💧 Avoid overhead irrigation"
+    ),
+    'leaf_blight': (
+        "🌽 Northern Leaf Blight Treatment:",
+        "💊 Apply fungicide containing propiconazole",
+        "🔄 Practice crop rotation",
+        "🌱 Use resistant hybrid varieties",
+        "🗑️ Remove infected plant debris",
+        "🌬️ Improve air circulation"
+    ),
+    'esca': (
+        "🍇 Esca Disease Treatment:",
+        "✂️ Prune infected wood during dry weather",
+        "🩹 Apply wound protectant after pruning",
+        "💊 Use systemic fungicides (consult local expert)",
+        "🌱 Plant resistant grape varieties",
+        "🚫 Avoid excessive irrigation"
+    ),
+    'early_blight': (
+        "🍅 Early Blight Treatment:",
+        "💊 Apply fungicide containing chlorothalonil",
+        "🍂 Remove infected lower leaves",
+        "🌬️ Improve air circulation",
+        "💧 Water at soil level only",
+        "🛡️ Apply mulch to prevent soil splash"
+    ),
+    'early_blight_potato': (
+        "🥔 Early Blight Treatment:",
+        "💊 Apply fungicide containing chlorothalonil",
+        "🍂 Remove infected lower leaves",
+        "🌬️ Improve air circulation",
+        "💧 Water at soil level only",
+        "🛡️ Apply mulch to prevent soil splash"
+    ),
+    'late_blight': (
+        "🍅 Late Blight Treatment:",
+        "🚨 URGENT: This is a serious disease!",
+        "💊 Apply copper-based fungicide immediately",
+        "🗑️ Remove and destroy all infected plants",
+        "🌡️ Reduce humidity around plants",
+        "🚫 Do not compost infected material",
+        "📞 Contact agricultural extension service"
+    ),
+    'late_blight_potato': (
+        "🥔 Late Blight Treatment:",
+        "🚨 URGENT: This is a serious disease!",
+        "💊 Apply copper-based fungicide immediately",
+        "🗑️ Remove and destroy all infected plants",
+        "🌡️ Reduce humidity around plants",
+        "🚫 Do not compost infected material",
+        "📞 Contact agricultural extension service"
+    ),
+    'bacterial_spot': (
+        "🦠 Bacterial Spot Treatment:",
+        "💊 Apply copper-based bactericide",
+        "🌡️ Reduce humidity and improve ventilation",
+        "🚫 Avoid overhead watering",
+        "✂️ Remove infected plant parts",
+        "🔄 Rotate crops next season"
+    ),
+    'leaf_mold': (
+        "🍅 Leaf Mold Treatment:",
+        "🌡️ Reduce humidity (below 85%)",
+        "🌬️ Increase ventilation in greenhouse",
+        "💊 Apply fungicide containing myclobutanil",
+        "✂️ Remove infected leaves",
+        "🌱 Plant resistant varieties"
+    ),
+    'septoria_leaf_spot': (
+        "🍅 Septoria Leaf Spot Treatment:",
+        "💊 Apply fungicide containing chlorothalonil",
+        "🍂 Remove infected lower leaves",
+        "🛡️ Mulch around plants",
+        "💧 Water at soil level",
+        "✂️ Stake plants for better air flow"
+    ),
+    'spider_mites': (
+        "🕷️ Spider Mite Treatment:",
+        "💦 Spray with insecticidal soap",
+        "🌊 Increase humidity around plants",
+        "🔍 Use predatory mites as biological control",
+        "🚫 Avoid over-fertilizing with nitrogen",
+        "💧 Regular water spraying of leaves"
+    ),
+    'target_spot': (
+        "🎯 Target Spot Treatment:",
+        "💊 Apply fungicide containing azoxystrobin",
+        "🌬️ Improve air circulation",
+        "💧 Avoid overhead irrigation",
+        "🔄 Rotate crops",
+        "🗑️ Remove plant debris"
+    ),
+    'mosaic_virus': (
+        "🦠 Mosaic Virus Management:",
+        "🚫 No cure available - remove infected plants",
+        "🐛 Control aphids and other virus vectors",
+        "🌱 Plant virus-resistant varieties",
+        "🧤 Sanitize tools between plants",
+        "🚫 Do not smoke near plants (TMV)"
+    ),
+    'yellow_leaf_curl': (
+        "🍃 Yellow Leaf Curl Virus Management:",
+        "🚫 Remove infected plants immediately",
+        "🐛 Control whiteflies (virus vector)",
+        "🛡️ Use reflective mulch",
+        "🌱 Plant resistant varieties",
+        "🏠 Use insect-proof screening in greenhouses"
+    )
+}
+
+# Generic recommendations for unknown diseases
+_GENERIC = (
+    "💊 Apply broad-spectrum fungicide",
+    "✂️ Remove affected plant parts",
+    "🌬️ Improve air circulation",
+    "💧 Adjust watering practices",
+    "📞 Consult local agricultural extension service"
+)
+
+# General prevention recommendations
+_PREVENTION = (
+    "",
+    "🛡️ Prevention for the Future:",
+    "🧹 Maintain garden cleanliness",
+    "🔄 Practice crop rotation",
+    "🌱 Choose disease-resistant varieties",
+    "📊 Monitor plants regularly",
+    "💧 Use proper irrigation techniques"
+)
+
+# Recommendation token per disease-name keyword, in the order the checks take precedence
+_DISEASE_KEYWORDS = (
+    ('healthy', ('healthy',)),
+    ('scab', ('scab',)),
+    ('black_rot', ('black_rot', 'black rot')),
+    ('rust', ('rust',)),
+    ('leaf_spot', ('cercospora', 'gray_leaf_spot')),
+    ('leaf_blight', ('leaf_blight',)),
+    ('esca', ('esca', 'black_measles')),
+    ('early_blight', ('early_blight',)),
+    ('late_blight', ('late_blight',)),
+    ('bacterial_spot', ('bacterial_spot',)),
+    ('leaf_mold', ('leaf_mold',)),
+    ('septoria_leaf_spot', ('septoria_leaf_spot',)),
+    ('spider_mites', ('spider_mites',)),
+    ('target_spot', ('target_spot',)),
+    ('mosaic_virus', ('mosaic_virus',)),
+    ('yellow_leaf_curl', ('yellow_leaf_curl',))
+)
+
+def _canonical(disease_type: str) -> Optional[str]:
+    """Map a disease name to its highest-precedence recommendation token"""
+    disease_lower = disease_type.lower()
+    for token, keywords in _DISEASE_KEYWORDS:
+        for keyword in keywords:
+            if keyword in disease_lower:
+                return token
+    return None
+
+# Class ids map to fixed names, so predictions look their token up instead of scanning
+_TOKEN_BY_IDX = tuple(_canonical(disease) for disease in _DISEASE_BY_IDX)
+
 def get_disease_recommendations(plant_name: str, disease_type: str, severity: str) -> List[str]:
     """Get detailed treatment recommendations based on plant, disease type, and severity"""
-    
+    return recommendations_for(plant_name, _canonical(disease_type), severity)
+
+def recommendations_for(plant_name: str, token: Optional[str], severity: str) -> List[str]:
+    """Get treatment recommendations for a plant and an already-resolved disease token"""
     # Base recommendations for healthy plants
-    if 'healthy' in disease_type.lower():
-        return [
-            f"✅ Your {plant_name.lower()} plant appears healthy!",
-            "🌱 Continue current care practices",
-            "👀 Monitor for any changes in plant appearance",
-            "💧 Maintain proper watering schedule",
-            "☀️ Ensure adequate sunlight exposure",
-            "🌬️ Provide good air circulation"
-        ]
-    
-    recommendations = []
-    
-    # Severity-based urgency
-    if severity == 'high':
-        recommendations.append("🚨 URGENT: Immediate action required!")
-    elif severity == 'medium':
-        recommendations.append("⚠️ Moderate intervention needed")
-    else:
-        recommendations.append("ℹ️ Early stage treatment recommended")
-    
-    # Disease-specific recommendations
-    disease_lower = disease_type.lower()
+    if token == 'healthy':
+        return [f"✅ Your {plant_name.lower()} plant appears healthy!", *_HEALTHY_CARE]
     
-    if 'scab' in disease_lower:
-        recommendations.extend([
-            "🍎 Apple Scab Treatment:",
-            "🍂 Remove fallen leaves and infected fruit immediately",
-            "💊 Apply fungicide containing captan or myclobutanil",
-            "✂️ Prune to improve air circulation",
-            "🚫 Avoid overhead watering",
-            "🔄 Rotate fungicide types to prevent resistance"
-        ])
+    if token in ('early_blight', 'late_blight') and plant_name.lower() == 'potato':
+        token = f"{token}_potato"
     
-    elif 'black_rot' in disease_lower or 'black rot' in disease_lower:
-        recommendations.extend([
-            "🦠 Black Rot Treatment:",
-            "✂️ Prune out infected branches and cankers",
-            "🗑️ Remove and destroy all infected plant material",
-            "💊 Apply copper-based fungicide",
-            "🌡️ Improve air circulation and reduce humidity",
-            "🚫 Avoid watering late in the day"
-        ])
-    
-    elif 'cedar_apple_rust' in disease_lower or 'rust' in disease_lower:
-        recommendations.extend([
-            "🦀 Rust Disease Treatment:",
-            "🌲 Remove nearby juniper plants if possible",
-            "💊 Apply sulfur-based fungicide",
-            "🍂 Remove infected leaves immediately",
-            "🌬️ Ensure good air circulation",
-            "🚫 Avoid overhead irrigation"
-        ])
-    
-    elif 'cercospora' in disease_lower or 'gray_leaf_spot' in disease_lower:
-        recommendations.extend([
-            "🌽 Corn Leaf Spot Treatment:",
-            "🔄 Implement crop rotation",
-            "💊 Apply fungicide containing strobilurin",
-            "🌱 Plant resistant corn varieties",
-            "🗑️ Remove crop debris after harvest",
-            "💧 Avoid overhead irrigation"
-        ])
-    
-    elif 'common_rust' in disease_lower:
-        recommendations.extend([
-            "🌽 Common Rust Treatment:",
-            "💊 Apply fungicide containing azoxystrobin",
-            "🌱 Plant rust-resistant varieties",
-            "🌬️ Ensure proper plant spacing",
-            "💧 Water at soil level",
-            "🔍 Monitor weather conditions (high humidity)"
-        ])
-    
-    elif 'northern_leaf_blight' in disease_lower or 'leaf_blight' in disease_lower:
-        recommendations.extend([
-            "🌽 Northern Leaf Blight Treatment:",
-            "💊 Apply fungicide containing propiconazole",
-            "🔄 Practice crop rotation",
-            "🌱 Use resistant hybrid varieties",
-            "🗑️ Remove infected plant debris",
-            "🌬️ Improve air circulation"
-        ])
-    
-    elif 'esca' in disease_lower or 'black_measles' in disease_lower:
-        recommendations.extend([
-            "🍇 Esca Disease Treatment:",
-            "✂️ Prune infected wood during dry weather",
-            "🩹 Apply wound protectant after pruning",
-            "💊 Use systemic fungicides (consult local expert)",
-            "🌱 Plant resistant grape varieties",
-            "🚫 Avoid excessive irrigation"
-        ])
-    
-    elif 'early_blight' in disease_lower:
-        plant_emoji = "🥔" if plant_name.lower() == "potato" else "🍅"
-        recommendations.extend([
-            f"{plant_emoji} Early Blight Treatment:",
-            "💊 Apply fungicide containing chlorothalonil",
-            "🍂 Remove infected lower leaves",
-            "🌬️ Improve air circulation",
-            "💧 Water at soil level only",
-            "🛡️ Apply mulch to prevent soil splash"
-        ])
-    
-    elif 'late_blight' in disease_lower:
-        plant_emoji = "🥔" if plant_name.lower() == "potato" else "🍅"
-        recommendations.extend([
-            f"{plant_emoji} Late Blight Treatment:",
-            "🚨 URGENT: This is a serious disease!",
-            "💊 Apply copper-based fungicide immediately",
-            "🗑️ Remove and destroy all infected plants",
-            "🌡️ Reduce humidity around plants",
-            "🚫 Do not compost infected material",
-            "📞 Contact agricultural extension service"
-        ])
-    
-    elif 'bacterial_spot' in disease_lower:
-        recommendations.extend([
-            "🦠 Bacterial Spot Treatment:",
-            "💊 Apply copper-based bactericide",
-            "🌡️ Reduce humidity and improve ventilation",
-            "🚫 Avoid overhead watering",
-            "✂️ Remove infected plant parts",
-            "🔄 Rotate crops next season"
-        ])
-    
-    elif 'leaf_mold' in disease_lower:
-        recommendations.extend([
-            "🍅 Leaf Mold Treatment:",
-            "🌡️ Reduce humidity (below 85%)",
-            "🌬️ Increase ventilation in greenhouse",
-            "💊 Apply fungicide containing myclobutanil",
-            "✂️ Remove infected leaves",
-            "🌱 Plant resistant varieties"
-        ])
-    
-    elif 'septoria_leaf_spot' in disease_lower:
-        recommendations.extend([
-            "🍅 Septoria Leaf Spot Treatment:",
-            "💊 Apply fungicide containing chlorothalonil",
-            "🍂 Remove infected lower leaves",
-            "🛡️ Mulch around plants",
-            "💧 Water at soil level",
-            "✂️ Stake plants for better air flow"
-        ])
-    
-    elif 'spider_mites' in disease_lower:
-        recommendations.extend([
-            "🕷️ Spider Mite Treatment:",
-            "💦 Spray with insecticidal soap",
-            "🌊 Increase humidity around plants",
-            "🔍 Use predatory mites as biological control",
-            "🚫 Avoid over-fertilizing with nitrogen",
-            "💧 Regular water spraying of leaves"
-        ])
-    
-    elif 'target_spot' in disease_lower:
-        recommendations.extend([
-            "🎯 Target Spot Treatment:",
-            "💊 Apply fungicide containing azoxystrobin",
-            "🌬️ Improve air circulation",
-            "💧 Avoid overhead irrigation",
-            "🔄 Rotate crops",
-            "🗑️ Remove plant debris"
-        ])
-    
-    elif 'mosaic_virus' in disease_lower:
-        recommendations.extend([
-            "🦠 Mosaic Virus Management:",
-            "🚫 No cure available - remove infected plants",
-            "🐛 Control aphids and other virus vectors",
-            "🌱 Plant virus-resistant varieties",
-            "🧤 Sanitize tools between plants",
-            "🚫 Do not smoke near plants (TMV)"
-        ])
-    
-    elif 'yellow_leaf_curl' in disease_lower:
-        recommendations.extend([
-            "🍃 Yellow Leaf Curl Virus Management:",
-            "🚫 Remove infected plants immediately",
-            "🐛 Control whiteflies (virus vector)",
-            "🛡️ Use reflective mulch",
-            "🌱 Plant resistant varieties",
-            "🏠 Use insect-proof screening in greenhouses"
-        ])
-    
-    else:
-        # Generic recommendations for unknown diseases
-        recommendations.extend([
-            "💊 Apply broad-spectrum fungicide",
-            "✂️ Remove affected plant parts",
-            "🌬️ Improve air circulation",
-            "💧 Adjust watering practices",
-            "📞 Consult local agricultural extension service"
-        ])
-    
-    # General prevention recommendations
-    recommendations.extend([
-        "",
-        "🛡️ Prevention for the Future:",
-        "🧹 Maintain garden cleanliness",
-        "🔄 Practice crop rotation",
-        "🌱 Choose disease-resistant varieties",
-        "📊 Monitor plants regularly",
-        "💧 Use proper irrigation techniques"
-    ])
-    
-    return recommendations
+    return list(_SEVERITY.get(severity, _SEVERITY['low']) + _RECO_TABLE.get(token, _GENERIC) + _PREVENTION)
+
+def run_tflite_inference(images: List[np.ndarray]) -> np.ndarray:
+    """Run the TFLite model on preprocessed (1, H, W, 3) images and return dequantized scores"""
+    global input_details, output_details
+    batch = np.concatenate(images)
+    if tuple(input_details[0]['shape']) != batch.shape:
+        # Batch size changed, resize the input tensor and re-plan the arena
+        interpreter.resize_tensor_input(input_details[0]['index'], batch.shape)
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+    input_detail = input_details[0]
+    output_detail = output_details[0]
+    
+    # Quantize the normalized input into the model's int8 domain
+    if input_detail['dtype'] == np.int8:
+        scale, zero_point = input_detail['quantization']
+        batch = np.clip(np.round(batch / scale + zero_point), -128, 127).astype(np.int8)
+    
+    interpreter.set_tensor(input_detail['index'], batch)
+    interpreter.invoke()
+    output = interpreter.get_tensor(output_detail['index'])
+    
+    # Dequantize back to probabilities
+    if output_detail['dtype'] == np.int8:
+        scale, zero_point = output_detail['quantization']
+        output = (output.astype(np.float32) - zero_point) * scale
+    return output
 
-def predict_disease(image_data: bytes, plant_type: str = None) -> Dict:
-    """Predict plant disease from image"""
+def utc_timestamp() -> str:
+    """Current UTC time in ISO format, reformatted at most once per second"""
+    global _cached_timestamp
+    checked_at, formatted = _cached_timestamp
+    now = time.monotonic()
+    if now - checked_at >= 1.0:
+        formatted = datetime.utcnow().isoformat()
+        # Swapped as one tuple, so concurrent readers never see a mismatched pair
+        _cached_timestamp = (now, formatted)
+    return formatted
+
+def run_inference_batch(images: List[np.ndarray]) -> np.ndarray:
+    """Run whichever model is loaded on a list of preprocessed (1, H, W, 3) images"""
+    if interpreter is not None:
+        return run_tflite_inference(images)
+    return keras_infer(tf.constant(np.concatenate(images))).numpy()
+
+_batcher = MicroBatcher(run_inference_batch, MB_MAX_BATCH, MB_MAX_LATENCY_MS)
+
+def ensure_worker_model() -> bool:
+    """(Re)build the model once per forked worker before it serves; False if unusable"""
+    global _MODEL_READY
+    with _model_lock:
+        if _MODEL_READY and _model_pid != os.getpid():
+            # A TFLite interpreter built in the gunicorn master lost its kernel thread pool in
+            # the fork, so rebuild it over the same mmap'd FlatBuffer; a deferred Keras model
+            # is loaded, traced and warmed up here for the first time
+            _MODEL_READY = load_model()
+            if not _MODEL_READY:
+                logger.error(f"Failed to rebuild the model in worker {os.getpid()}")
+    return _MODEL_READY
+
+def predict_disease(file_stream: IO[bytes], plant_type: str = None) -> Dict:
+    """Predict plant disease from an uploaded image stream"""
     try:
-        logger.info("Starting disease prediction...")
+        logger.debug("Starting disease prediction...")
         
-        if model is None:
+        if model is None and interpreter is None:
             logger.error("Model not loaded")
             raise ValueError("Model not loaded")
         
         # Preprocess image
-        processed_image = preprocess_image(image_data)
+        processed_image = preprocess_image(file_stream)
         
-        # For demonstration purposes, we'll create a mock prediction
-        # In a real scenario, this would use the trained model
-        logger.info("Running model prediction...")
+        logger.debug("Running model prediction...")
         
-        # Mock prediction logic (replace with actual model.predict)
-        if plant_type and plant_type.lower() in PLANT_TYPES:
+        if interpreter is not None or keras_infer is not None:
+            predictions = _batcher.submit(processed_image)[0]
+            if plant_type and plant_type.lower() in PLANT_TYPES:
+                # Best prediction within the specified plant type
+                valid_indices = PLANT_TYPES[plant_type.lower()]
+                predicted_class_idx = valid_indices[int(np.argmax(predictions[valid_indices]))]
+            else:
+                predicted_class_idx = int(np.argmax(predictions))
+            confidence = float(predictions[predicted_class_idx])
+        
+        # For demonstration purposes, a freshly created (untrained) CNN gets a mock prediction
+        elif plant_type and plant_type.lower() in PLANT_TYPES:
             # Get random prediction from the specified plant type
             valid_indices = PLANT_TYPES[plant_type.lower()]
-            predicted_class_idx = int(np.random.choice(valid_indices))
-            confidence = float(np.random.uniform(0.7, 0.95))
+            predicted_class_idx = random.choice(valid_indices)
+            confidence = random.uniform(0.7, 0.95)
         else:
             # Random prediction from all classes
-            predicted_class_idx = int(np.random.choice(list(DISEASE_CLASSES.keys())))
-            confidence = float(np.random.uniform(0.6, 0.9))
+            predicted_class_idx = random.choice(_ALL_CLASS_IDS)
+            confidence = random.uniform(0.6, 0.9)
         
         # Get disease information
-        disease_name = DISEASE_CLASSES.get(predicted_class_idx, 'Unknown')
-        parts = disease_name.split('___')
-        plant_name = parts[0]
-        disease_type = parts[1] if len(parts) > 1 else 'Unknown'
-        
-        # Determine if plant is healthy
-        is_healthy = 'healthy' in disease_type.lower()
+        plant_name = _PLANT_BY_IDX[predicted_class_idx]
+        disease_type = _DISEASE_BY_IDX[predicted_class_idx]
+        is_healthy = _IS_HEALTHY_BY_IDX[predicted_class_idx]
         
-        # Get severity level
+        # Get severity level (plain comparisons send a NaN score to 'low')
         if is_healthy:
             severity = 'none'
-        elif confidence > 0.8:
-            severity = 'high'
-        elif confidence > 0.6:
-            severity = 'medium'
         else:
-            severity = 'low'
+            severity = 'high' if confidence > 0.8 else 'medium' if confidence > 0.6 else 'low'
         
         # Get recommendations
-        recommendations = get_disease_recommendations(plant_name, disease_type, severity)
+        recommendations = recommendations_for(plant_name, _TOKEN_BY_IDX[predicted_class_idx], severity)
         
         return {
             'plant_name': plant_name,
@@ -453,52 +617,19 @@ def predict_disease(image_data: bytes, plant_type: str = None) -> Dict:
             'severity': severity,
             'recommendations': recommendations,
             'class_id': int(predicted_class_idx),
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': utc_timestamp()
         }
         
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise ValueError(f"Prediction failed: {str(e)}")
 
-@app.route('/', methods=['GET'])
-def root():
-    """Root endpoint - API info"""
-    return jsonify({
-        'message': 'Plant Disease Detection API',
-        'version': '1.0.0',
-        'status': 'running',
-        'endpoints': {
-            'health': '/api/health',
-            'predict': '/api/predict (POST)',
-            'supported_plants': '/api/plants/supported',
-            'disease_info': '/api/disease-info',
-            'recommendations': '/api/recommend/<plant>/<disease>'
-        },
-        'documentation': 'https://github.com/Ragul2105/msme-backend'
-    })
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'model_loaded': model is not None,
-        'supported_plants': list(PLANT_TYPES.keys()),
-        'total_disease_classes': len(DISEASE_CLASSES),
-        'timestamp': datetime.utcnow().isoformat()
-    })
-
-@app.route('/api/plants/supported', methods=['GET'])
-def get_supported_plants():
-    """Get list of supported plants and their diseases"""
+def supported_plants_payload() -> Dict:
+    """Build the list of supported plants and their diseases"""
     plant_info = {}
     
     for plant, class_indices in PLANT_TYPES.items():
-        diseases = []
-        for idx in class_indices:
-            disease_full = DISEASE_CLASSES[idx]
-            disease_name = disease_full.split('___')[1] if '___' in disease_full else disease_full
-            diseases.append(disease_name)
+        diseases = [_DISEASE_BY_IDX[idx] for idx in class_indices]
         
         plant_info[plant] = {
             'name': plant.capitalize(),
@@ -506,23 +637,22 @@ def get_supported_plants():
             'total_classes': len(class_indices)
         }
     
-    return jsonify({
+    return {
         'success': True,
         'supported_plants': plant_info,
         'total_plants': len(PLANT_TYPES)
-    })
+    }
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Predict plant disease from uploaded image"""
     try:
-        # Ensure model is loaded
-        if model is None:
-            if not load_model():
-                return jsonify({
-                    'error': 'Model not available',
-                    'details': 'Could not load the prediction model'
-                }), 500
+        # Models are loaded at startup (and rebuilt once per forked worker), never per request
+        if not ensure_worker_model():
+            return jsonify({
+                'error': 'Model not ready',
+                'details': 'The prediction model failed to load'
+            }), 503
         
         # Check if image file is present
         if 'image' not in request.files:
@@ -538,32 +668,23 @@ def predict():
         if plant_type and plant_type not in PLANT_TYPES:
             return jsonify({
                 'error': f'Unsupported plant type: {plant_type}',
-                'supported_types': list(PLANT_TYPES.keys())
+                'supported_types': _SUPPORTED_TYPES_LIST
             }), 400
         
         # Validate file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
-        if not ('.' in file.filename and 
-                file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+        if os.path.splitext(file.filename)[1][1:].lower() not in _ALLOWED_EXT:
             return jsonify({
                 'error': 'Invalid file type',
-                'supported_formats': list(allowed_extensions)
+                'supported_formats': _ALLOWED_EXT_LIST
             }), 400
         
-        # Read image data
-        image_data = file.read()
-        
-        # Validate image size
-        if len(image_data) > 16 * 1024 * 1024:  # 16MB
-            return jsonify({'error': 'Image too large. Maximum size is 16MB'}), 400
-        
-        # Make prediction
-        result = predict_disease(image_data, plant_type)
+        # Make prediction; MAX_CONTENT_LENGTH already rejects uploads over 16MB
+        result = predict_disease(file.stream, plant_type)
         
         return jsonify({
             'success': True,
             'prediction': result,
-            'processing_time': datetime.utcnow().isoformat()
+            'processing_time': utc_timestamp()
         })
         
     except ValueError as ve:
@@ -589,7 +710,7 @@ def get_recommendations_for_disease(plant, disease):
         if plant.lower() not in PLANT_TYPES:
             return jsonify({
                 'error': 'Unsupported plant type',
-                'supported_types': list(PLANT_TYPES.keys())
+                'supported_types': _SUPPORTED_TYPES_LIST
             }), 400
         
         recommendations = get_disease_recommendations(plant, disease, severity)
@@ -609,31 +730,82 @@ def get_recommendations_for_disease(plant, disease):
             'details': str(e)
         }), 500
 
-@app.route('/api/disease-info', methods=['GET'])
-def get_disease_info():
-    """Get comprehensive disease information database"""
+def disease_info_payload() -> Dict:
+    """Build the disease information database"""
     disease_info = {}
     
     for class_id, disease_full in DISEASE_CLASSES.items():
-        parts = disease_full.split('___')
-        plant = parts[0]
-        disease = parts[1] if len(parts) > 1 else 'Unknown'
+        plant = _PLANT_BY_IDX[class_id]
         
         if plant not in disease_info:
             disease_info[plant] = []
         
         disease_info[plant].append({
             'id': class_id,
-            'name': disease,
+            'name': _DISEASE_BY_IDX[class_id],
             'full_name': disease_full,
-            'is_healthy': 'healthy' in disease.lower()
+            'is_healthy': _IS_HEALTHY_BY_IDX[class_id]
         })
     
-    return jsonify({
+    return {
         'success': True,
         'disease_database': disease_info,
         'total_classes': len(DISEASE_CLASSES)
-    })
+    }
+
+# Responses built only from the class constants, serialized once at import
+_ROOT_JSON = orjson.dumps({
+    'message': 'Plant Disease Detection API',
+    'version': '1.0.0',
+    'status': 'running',
+    'endpoints': {
+        'health': '/api/health',
+        'predict': '/api/predict (POST)',
+        'supported_plants': '/api/plants/supported',
+        'disease_info': '/api/disease-info',
+        'recommendations': '/api/recommend/<plant>/<disease>'
+    },
+    'documentation': 'https://github.com/Ragul2105/msme-backend'
+})
+_PLANTS_JSON = orjson.dumps(supported_plants_payload())
+_DISEASE_INFO_JSON = orjson.dumps(disease_info_payload())
+
+# Health body with %-placeholders for the only two fields that change between requests
+_HEALTH_TEMPLATE = orjson.dumps({
+    'status': 'healthy',
+    'model_loaded': '__MODEL_LOADED__',
+    'supported_plants': list(PLANT_TYPES.keys()),
+    'total_disease_classes': len(DISEASE_CLASSES),
+    'timestamp': '__TIMESTAMP__'
+}).decode().replace('%', '%%').replace('"__MODEL_LOADED__"', '%s').replace('__TIMESTAMP__', '%s')
+
+@app.route('/', methods=['GET'])
+def root():
+    """Root endpoint - API info"""
+    return Response(_ROOT_JSON, mimetype='application/json')
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    # Whether this worker can serve predictions; also does its one-time post-fork model rebuild
+    model_loaded = ensure_worker_model()
+    body = _HEALTH_TEMPLATE % ('true' if model_loaded else 'false', utc_timestamp())
+    return Response(body, mimetype='application/json')
+
+@app.route('/api/plants/supported', methods=['GET'])
+def get_supported_plants():
+    """Get list of supported plants and their diseases"""
+    return Response(_PLANTS_JSON, mimetype='application/json')
+
+@app.route('/api/disease-info', methods=['GET'])
+def get_disease_info():
+    """Get comprehensive disease information database"""
+    return Response(_DISEASE_INFO_JSON, mimetype='application/json')
+
+if __name__ != '__main__':
+    # Under gunicorn with preload_app this runs once in the master, so workers fork with
+    # the TFLite model already mapped; a Keras fallback is left for each worker to load
+    _MODEL_READY = load_model(defer_keras=True)
 
 if __name__ == '__main__':
     print("🌱 Starting Plant Disease Detection Backend...")
@@ -641,22 +813,25 @@ if __name__ == '__main__':
     for plant, indices in PLANT_TYPES.items():
         print(f"   - {plant.capitalize()}: {len(indices)} disease classes")
     
-    # Load model on startup
-    if load_model():
+    # Load model on startup; --bootstrap-model creates an untrained CNN (mock predictions) if none exists
+    _MODEL_READY = load_model(bootstrap='--bootstrap-model' in sys.argv[1:])
+    if _MODEL_READY:
         print("✅ Model loaded successfully")
     else:
-        print("⚠️ Warning: Model not loaded, using mock predictions")
+        print("⚠️ Warning: Model not loaded, predictions will return 503 (use --bootstrap-model for mock predictions)")
     
     # Run the app
     port = int(os.getenv('PORT', 3001))
     debug = os.getenv('FLASK_ENV') == 'development'
     
     print(f"🚀 Starting server on http://0.0.0.0:{port}")
+    # Threaded so one request's image decode overlaps another's inference; the
+    # interpreter itself is only ever invoked from the batcher thread
     try:
-        app.run(host='0.0.0.0', port=port, debug=debug)
+        app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
     except OSError as e:
         if "Address already in use" in str(e):
             print(f"Port {port} is in use. Trying port {port + 1}...")
-            app.run(host='0.0.0.0', port=port + 1, debug=debug)
+            app.run(host='0.0.0.0', port=port + 1, debug=debug, threaded=True)
         else:
             raise e
\ No newline at end of file
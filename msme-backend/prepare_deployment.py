@@ -13,6 +13,7 @@ def check_files():
     
     required_files = [
         'plant_disease_app.py',
+        'serving.py',
         'main.py',
         'requirements.txt',
         'runtime.txt',
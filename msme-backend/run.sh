@@ -5,7 +5,7 @@ echo "🚀 Starting Plant Disease Detection API..."
 echo "📦 Environment: $(python --version)"
 
 # Create model if it doesn't exist
-if [ ! -f "plant_disease_model.h5" ]; then
+if [ ! -f "plant_disease_model.tflite" ]; then
     echo "🤖 Creating ML model..."
     python setup_model.py
 fi
@@ -0,0 +1,105 @@
+"""
+Inference serving helpers shared by plant_disease_app.py and app_test.py
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime
+from typing import Callable, List
+import numpy as np
+import tensorflow as tf
+from flask.json.provider import JSONProvider
+import orjson
+
+logger = logging.getLogger(__name__)
+
+def _orjson_default(obj):
+    """Serialize types orjson doesn't handle natively (e.g. Firestore timestamp subclasses)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, with native numpy support"""
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_orjson_default, option=self.option),
+            mimetype='application/json'
+        )
+
+def load_xnnpack_delegate(delegate_path: str, num_threads: int) -> List:
+    """Load the XNNPACK delegate so int8/fp16/fp32 kernels use SIMD (AVX2/AVX-512/NEON)"""
+    try:
+        delegate = tf.lite.experimental.load_delegate(delegate_path, {'num_threads': str(num_threads)})
+        logger.info(f"XNNPACK delegate loaded from: {delegate_path}")
+        return [delegate]
+    except (ValueError, OSError) as e:
+        logger.info(f"XNNPACK delegate library not available ({e}), using built-in XNNPACK kernels")
+        return []
+
+class MicroBatcher:
+    """Stack concurrent single-image requests into one forward pass on a background thread"""
+
+    def __init__(self, run_batch: Callable[[List[np.ndarray]], np.ndarray], max_batch: int, max_wait_ms: float):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        # Batches are padded up to powers of two (capped at max_batch), so the interpreter
+        # only resizes its input and re-applies its delegate when the bucket changes
+        self.batch_sizes = tuple(sorted({min(1 << i, max_batch) for i in range(max_batch.bit_length() + 1)}))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _worker(self):
+        """Coalesce queued images into one forward pass and hand each request its row"""
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(items) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            images = [image for image, _ in items]
+            padded_size = next(size for size in self.batch_sizes if size >= len(images))
+            # Padding rows repeat the first image; their scores are never handed out
+            images += images[:1] * (padded_size - len(images))
+            try:
+                predictions = self.run_batch(images)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(items):
+                future.set_result(predictions[i:i + 1])
+
+    def submit(self, processed_image: np.ndarray) -> np.ndarray:
+        """Queue a single preprocessed (1, H, W, 3) image and wait for its scores"""
+        # Started lazily so every forked gunicorn worker gets its own batcher thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name='inference-batcher', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((processed_image, future))
+        return future.result()
@@ -4,39 +4,209 @@ Script to download a pre-trained plant disease detection model
 """
 
 import os
-import urllib.request
-import tensorflow as tf
-import numpy as np
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import orjson
+import requests
 
-def create_and_save_model():
-    """Create a simple CNN model for plant disease detection and save it"""
-    print("🤖 Creating plant disease detection model...")
+# TensorFlow/NumPy (and convert_to_tflite, which imports TensorFlow) are imported inside
+# the functions that build or load a model, so importing this module stays cheap
+
+# The TensorRT engine build is opt-in (EXPORT_TENSORRT=1) since it needs a visible GPU
+EXPORT_TENSORRT = os.getenv('EXPORT_TENSORRT', '').lower() in ('1', 'true', 'yes')
+
+# Setup runs a single small forward pass and conversions: skip CUDA device probing
+# (unless building the TensorRT engine), keep oneDNN's CPU kernels on and silence TF's
+# C++ info/warning logs. These must be set before TensorFlow is first imported; values
+# already in the environment win.
+if not EXPORT_TENSORRT:
+    os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1')
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+# The .h5 is kept as the Keras checkpoint; the API serves the TFLite FlatBuffer
+MODEL_PATH = 'plant_disease_model.h5'
+TFLITE_MODEL_PATH = 'plant_disease_model.tflite'
+TFLITE_INT8_MODEL_PATH = 'plant_disease_model_int8.tflite'
+TFLITE_FP16_MODEL_PATH = 'plant_disease_model_fp16.tflite'
+SAVEDMODEL_PATH = 'plant_disease_savedmodel'
+# Optional GPU artifacts, written only when tf2onnx / TensorRT are installed
+ONNX_MODEL_PATH = 'plant_disease.onnx'
+TENSORRT_ENGINE_PATH = 'plant_disease.engine'
+TENSORRT_MAX_BATCH = 32
+
+# Seeds Python, NumPy and TF so the initial weights (and calibration data) are reproducible
+MODEL_SEED = 42
+
+# 'mobilenetv2' (ImageNet-pretrained features) or 'cnn' (the original custom CNN)
+MODEL_BACKBONE = os.getenv('MODEL_BACKBONE', 'mobilenetv2').lower()
+
+def random_calibration_images():
+    """(224, 224, 3) float32 inputs in the model's [0, 1] range for INT8 calibration"""
+    import numpy as np
+    from convert_to_tflite import NUM_CALIBRATION_IMAGES
+    # No training images here, so calibrate on random inputs; for a trained model re-run:
+    # python convert_to_tflite.py <training-images-dir> plant_disease_model.h5
+    return [np.random.random((224, 224, 3)).astype(np.float32) for _ in range(NUM_CALIBRATION_IMAGES)]
+
+def export_tflite(model):
+    """Write the TFLite variants the API picks from with MODEL_PRECISION (mmap'd, no Keras layer rebuild at startup)"""
+    from convert_to_tflite import convert_fp16, convert_fp32, convert_int8
+    print("📦 Exporting TFLite models...")
+    return {
+        'fp32': convert_fp32(model, TFLITE_MODEL_PATH),
+        'int8': convert_int8(model, random_calibration_images(), TFLITE_INT8_MODEL_PATH),
+        'fp16': convert_fp16(model, TFLITE_FP16_MODEL_PATH)
+    }
+
+def export_onnx(model):
+    """Export the model to ONNX with a dynamic batch dimension (needs the optional tf2onnx package)"""
+    try:
+        import tf2onnx
+    except ImportError:
+        print("ℹ️ tf2onnx not installed, skipping ONNX export")
+        return None
+    import tensorflow as tf
+    input_signature = (tf.TensorSpec((None, 224, 224, 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, output_path=ONNX_MODEL_PATH)
+    print(f"💾 ONNX model saved to: {ONNX_MODEL_PATH}")
+    return ONNX_MODEL_PATH
+
+def export_tensorrt(onnx_path):
+    """Build a serialized INT8 TensorRT engine from the ONNX export (GPU hosts with TensorRT and PyCUDA only)"""
+    try:
+        import tensorrt as trt
+        import pycuda.autoinit  # noqa: F401 - creates the CUDA context
+        import pycuda.driver as cuda
+    except Exception as e:
+        # Also covers no visible GPU (e.g. CUDA_VISIBLE_DEVICES='' set by the caller)
+        print(f"ℹ️ TensorRT unavailable ({e}), skipping TensorRT engine")
+        return None
+    import numpy as np
     
-    # Define the model architecture
-    model = tf.keras.Sequential([
+    class EntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        """Feeds the calibration images to TensorRT one at a time"""
+        def __init__(self, images):
+            trt.IInt8EntropyCalibrator2.__init__(self)
+            self.images = iter(images)
+            self.device_input = cuda.mem_alloc(images[0].nbytes)
+        
+        def get_batch_size(self):
+            return 1
+        
+        def get_batch(self, names):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            cuda.memcpy_htod(self.device_input, np.ascontiguousarray(image[np.newaxis]))
+            return [int(self.device_input)]
+        
+        def read_calibration_cache(self):
+            return None
+        
+        def write_calibration_cache(self, cache):
+            pass
+    
+    print("📦 Building TensorRT INT8 engine...")
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    with open(onnx_path, 'rb') as f:
+        if not parser.parse(f.read()):
+            raise RuntimeError(f"Could not parse {onnx_path}: {parser.get_error(0)}")
+    
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.INT8)
+    config.int8_calibrator = EntropyCalibrator(random_calibration_images())
+    # The ONNX batch dimension is dynamic: tune for single requests, allow micro-batches
+    profile = builder.create_optimization_profile()
+    profile.set_shape(network.get_input(0).name, (1, 224, 224, 3), (1, 224, 224, 3), (TENSORRT_MAX_BATCH, 224, 224, 3))
+    config.add_optimization_profile(profile)
+    config.set_calibration_profile(profile)
+    
+    engine = builder.build_serialized_network(network, config)
+    if engine is None:
+        raise RuntimeError("TensorRT engine build failed")
+    with open(TENSORRT_ENGINE_PATH, 'wb') as f:
+        f.write(engine)
+    print(f"💾 TensorRT engine saved to: {TENSORRT_ENGINE_PATH}")
+    return TENSORRT_ENGINE_PATH
+
+def model_cache_key(model):
+    """Content hash of the model architecture and seed, used to name its cached checkpoint"""
+    config = json.dumps(model.get_config(), sort_keys=True, default=str).encode()
+    return hashlib.blake2b(config + MODEL_SEED.to_bytes(8, 'little'), digest_size=16).hexdigest()
+
+def link_model(target):
+    """Atomically point MODEL_PATH at a content-addressed checkpoint"""
+    tmp_path = f'{MODEL_PATH}.tmp'
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, MODEL_PATH)
+
+def export_savedmodel(model):
+    """Save a SavedModel whose serving signature is one XLA-compiled function for any batch size"""
+    import tensorflow as tf
+    @tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.float32)], jit_compile=True)
+    def serve(x):
+        return model(x, training=False)
+    tf.saved_model.save(model, SAVEDMODEL_PATH, signatures={'serving_default': serve.get_concrete_function()})
+    print(f"💾 SavedModel saved to: {SAVEDMODEL_PATH}")
+    return SAVEDMODEL_PATH
+
+def build_mobilenet_model():
+    """Frozen ImageNet MobileNetV2 (alpha 0.75) features with a pooled softmax head"""
+    import tensorflow as tf
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    # The API feeds [0, 1] pixels; MobileNetV2 expects [-1, 1]
+    x = tf.keras.layers.Rescaling(2.0, offset=-1.0)(inputs)
+    base = tf.keras.applications.MobileNetV2(
+        input_shape=(224, 224, 3), include_top=False, weights='imagenet', alpha=0.75
+    )
+    base.trainable = False
+    x = base(x, training=False)
+    # Global pooling instead of Flatten keeps the head to 25 small Dense units
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(25, activation='softmax')(x)  # 25 classes total
+    return tf.keras.Model(inputs, outputs)
+
+def build_cnn_model():
+    """Custom CNN trained from scratch; used when pretrained weights are unavailable"""
+    import tensorflow as tf
+    # Each block is Conv2D -> BN -> ReLU -> MaxPool: BN directly on the conv output is
+    # folded into the conv weights at TFLite export (BN's beta replaces the conv bias)
+    return tf.keras.Sequential([
         # First Convolutional Block
-        tf.keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(224, 224, 3)),
-        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(32, (3, 3), use_bias=False, input_shape=(224, 224, 3)),
         tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.ReLU(),
+        tf.keras.layers.MaxPooling2D(2, 2),
         
         # Second Convolutional Block
-        tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
-        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(64, (3, 3), use_bias=False),
         tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.ReLU(),
+        tf.keras.layers.MaxPooling2D(2, 2),
         
         # Third Convolutional Block
-        tf.keras.layers.Conv2D(128, (3, 3), activation='relu'),
-        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(128, (3, 3), use_bias=False),
         tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.ReLU(),
+        tf.keras.layers.MaxPooling2D(2, 2),
         
         # Fourth Convolutional Block
-        tf.keras.layers.Conv2D(256, (3, 3), activation='relu'),
-        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(256, (3, 3), use_bias=False),
         tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.ReLU(),
+        tf.keras.layers.MaxPooling2D(2, 2),
         
-        # Flatten and Dense Layers
-        tf.keras.layers.Flatten(),
+        # Pool and Dense Layers: global pooling feeds Dense(512) 256 features instead of
+        # Flatten's 12*12*256, shrinking that layer from ~19M to ~0.13M weights
+        tf.keras.layers.GlobalAveragePooling2D(),
         tf.keras.layers.Dropout(0.5),
         tf.keras.layers.Dense(512, activation='relu'),
         tf.keras.layers.BatchNormalization(),
@@ -44,6 +214,38 @@ def create_and_save_model():
         tf.keras.layers.Dense(256, activation='relu'),
         tf.keras.layers.Dense(25, activation='softmax')  # 25 classes total
     ])
+
+def strip_dropout(model):
+    """Inference copy of a Sequential model without its Dropout layers (identity at inference)"""
+    import tensorflow as tf
+    if not isinstance(model, tf.keras.Sequential):
+        return model
+    layers = [layer for layer in model.layers if not isinstance(layer, tf.keras.layers.Dropout)]
+    if len(layers) == len(model.layers):
+        return model
+    # The remaining layers (and their weights) are shared with the original model
+    return tf.keras.Sequential([tf.keras.Input(shape=model.input_shape[1:])] + layers)
+
+def build_model():
+    """Build the configured backbone, falling back to the custom CNN when offline"""
+    if MODEL_BACKBONE == 'mobilenetv2':
+        try:
+            return build_mobilenet_model(), 'MobileNetV2'
+        except Exception as e:
+            print(f"⚠️ Could not load pretrained MobileNetV2 weights ({e}), using the custom CNN")
+    return build_cnn_model(), 'CNN'
+
+def create_and_save_model():
+    """Create the plant disease detection model and save it"""
+    import numpy as np
+    import tensorflow as tf
+    print("🤖 Creating plant disease detection model...")
+    
+    tf.keras.utils.set_random_seed(MODEL_SEED)
+    tf.config.experimental.enable_op_determinism()
+    model, model_type = build_model()
+    # Nothing is trained here, so save and export the inference graph without Dropout
+    model = strip_dropout(model)
     
     # Compile the model
     model.compile(
@@ -52,19 +254,42 @@ def create_and_save_model():
         metrics=['accuracy']
     )
     
-    print("📊 Model Architecture:")
-    model.summary()
-    
-    # Initialize weights with random values (simulating a pre-trained model)
-    # In a real scenario, these would be trained weights
-    print("🎲 Initializing model weights...")
-    dummy_input = np.random.random((1, 224, 224, 3))
-    _ = model.predict(dummy_input, verbose=0)
+    # The layer-by-layer summary is only useful when debugging the architecture
+    if os.environ.get('MSME_DEBUG'):
+        print("📊 Model Architecture:")
+        model.summary()
     
-    # Save the model
-    model_path = 'plant_disease_model.h5'
-    model.save(model_path)
-    print(f"💾 Model saved to: {model_path}")
+    # Checkpoints are stored per architecture hash, so a rebuild of the same
+    # architecture reuses the saved weights instead of initializing and saving again
+    cached_path = f'plant_disease_model_{model_cache_key(model)}.h5'
+    if os.path.exists(cached_path):
+        print(f"♻️ Reusing cached weights: {cached_path}")
+        model.load_weights(cached_path)
+    else:
+        # Initialize weights with random values (simulating a pre-trained model)
+        # In a real scenario, these would be trained weights
+        print("🎲 Initializing model weights...")
+        # Only the shape/dtype matter for the warmup trace, so skip the RNG and float64 cast
+        dummy_input = np.zeros((1, 224, 224, 3), dtype=np.float32)
+        # One graph-mode trace for any batch size, without predict()'s tf.data/distribution loop
+        @tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.float32)])
+        def _warm(x):
+            return model(x, training=False)
+        _ = _warm(tf.constant(dummy_input))
+        
+        # Save the model
+        model.save(cached_path)
+    link_model(cached_path)
+    print(f"💾 Model saved to: {MODEL_PATH} -> {cached_path}")
+    savedmodel_path = export_savedmodel(model)
+    tflite_models = export_tflite(model)
+    # The GPU artifacts are optional: a failed export must not fail the setup
+    onnx_path = tensorrt_path = None
+    try:
+        onnx_path = export_onnx(model)
+        tensorrt_path = export_tensorrt(onnx_path) if onnx_path and EXPORT_TENSORRT else None
+    except Exception as e:
+        print(f"⚠️ GPU model export failed ({e}), continuing with the TFLite models")
     
     # Create metadata file
     metadata = {
@@ -73,18 +298,43 @@ def create_and_save_model():
         'total_classes': 25,
         'input_shape': [224, 224, 3],
         'supported_plants': ['apple', 'corn', 'grape', 'potato', 'tomato'],
-        'model_type': 'CNN',
-        'framework': 'TensorFlow/Keras'
+        'model_type': model_type,
+        'framework': 'TensorFlow/Keras',
+        'savedmodel': savedmodel_path,
+        'tflite_models': tflite_models,
+        'onnx': onnx_path,
+        'tensorrt_engine': tensorrt_path
     }
     
-    with open('model_metadata.json', 'w') as f:
-        import json
-        json.dump(metadata, f, indent=2)
+    # Serialized to bytes up front and written in one call
+    with open('model_metadata.json', 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
     
     print("📝 Model metadata saved to: model_metadata.json")
     print("✅ Model creation completed successfully!")
     
-    return model_path
+    return tflite_models['fp32']
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+def probe_model_url(session, url):
+    """Return True if the model URL answers with HTTP 200 (the body is not read)"""
+    with session.get(url, stream=True, timeout=5) as response:
+        return response.status_code == 200
+
+def download_file(session, url, dest):
+    """Stream a download to disk in 1MB chunks, gzip-decoded when the server compresses it"""
+    with session.get(url, stream=True, timeout=10) as response:
+        response.raise_for_status()
+        with open(dest, 'wb') as f:
+            size = response.headers.get('Content-Length')
+            # Content-Length is the decoded size only for uncompressed responses
+            if size and 'Content-Encoding' not in response.headers and hasattr(os, 'posix_fallocate'):
+                # Reserve the file up front so it isn't grown (and fragmented) chunk by chunk
+                os.posix_fallocate(f.fileno(), 0, int(size))
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    return dest
 
 def download_plantvillage_model():
     """
@@ -99,18 +349,32 @@ def download_plantvillage_model():
         'plantdisease_cnn': 'https://example.com/plant_disease_cnn.h5'
     }
     
-    for model_name, url in model_urls.items():
-        print(f"🔍 Checking availability of {model_name}...")
-        try:
-            # Check if URL is accessible (this will fail with placeholder URLs)
-            response = urllib.request.urlopen(url)
-            if response.status == 200:
-                print(f"📥 Downloading {model_name}...")
-                urllib.request.urlretrieve(url, f'{model_name}.h5')
-                print(f"✅ Downloaded {model_name}.h5")
-                return f'{model_name}.h5'
-        except Exception as e:
-            print(f"❌ Could not download {model_name}: {e}")
+    # Probe every URL at once so the check costs one round trip, not one per URL. One
+    # session keeps the winner's connection alive for the download; requests already
+    # sends Accept-Encoding: gzip, deflate and decodes it while streaming.
+    session = requests.Session()
+    executor = ThreadPoolExecutor(max_workers=len(model_urls))
+    try:
+        futures = {}
+        for model_name, url in model_urls.items():
+            print(f"🔍 Checking availability of {model_name}...")
+            futures[executor.submit(probe_model_url, session, url)] = model_name
+        
+        for future in as_completed(futures):
+            model_name = futures[future]
+            try:
+                # Check if URL is accessible (this will fail with placeholder URLs)
+                if future.result():
+                    print(f"📥 Downloading {model_name}...")
+                    download_file(session, model_urls[model_name], f'{model_name}.h5')
+                    print(f"✅ Downloaded {model_name}.h5")
+                    return f'{model_name}.h5'
+            except Exception as e:
+                print(f"❌ Could not download {model_name}: {e}")
+    finally:
+        # Don't wait on the probes still in flight once one URL has won
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
     
     print("⚠️ No downloadable models available. Creating custom model instead.")
     return None
@@ -121,20 +385,32 @@ def main():
     print("=" * 50)
     
     # Check if model already exists
-    if os.path.exists('plant_disease_model.h5'):
-        print("✅ Model already exists: plant_disease_model.h5")
+    if os.path.exists(TFLITE_MODEL_PATH):
+        print(f"✅ Model already exists: {TFLITE_MODEL_PATH}")
         
         # Verify the model can be loaded
         try:
-            model = tf.keras.models.load_model('plant_disease_model.h5')
-            print(f"📊 Loaded model with input shape: {model.input_shape}")
-            print(f"📊 Model output shape: {model.output_shape}")
+            import tensorflow as tf
+            interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH)
+            interpreter.allocate_tensors()
+            print(f"📊 Loaded model with input shape: {interpreter.get_input_details()[0]['shape']}")
+            print(f"📊 Model output shape: {interpreter.get_output_details()[0]['shape']}")
             print("✅ Model verification successful!")
-            return 'plant_disease_model.h5'
+            return TFLITE_MODEL_PATH
         except Exception as e:
             print(f"❌ Error loading existing model: {e}")
             print("🔄 Will create a new model...")
     
+    elif os.path.exists(MODEL_PATH):
+        # Earlier setups only saved the Keras checkpoint; export it instead of replacing it
+        print(f"✅ Keras model found: {MODEL_PATH}")
+        try:
+            import tensorflow as tf
+            return export_tflite(tf.keras.models.load_model(MODEL_PATH))['fp32']
+        except Exception as e:
+            print(f"❌ Error exporting existing model: {e}")
+            print("🔄 Will create a new model...")
+    
     # For cloud deployment, always create a new model if none exists
     print("🌐 Cloud deployment detected - creating model...")
     return create_and_save_model()